@@ -1,40 +1,308 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
 from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api.proxies import GenericProxyConfig
 from google import genai
+from google.genai import errors
 import os
 import re
-import json
-from pydantic import BaseModel
-from typing import List, Optional
-from ddgs import DDGS
-from tenacity import retry, stop_after_attempt, wait_exponential
+import orjson
+from typing import Optional
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 import time
-import random
-import requests
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import httpx
 import subprocess
-import shlex
 
 
 load_dotenv()
 
-app = FastAPI()
+# ddgs (and its lxml/primp deps) is only needed for the image fetch below, so keep
+# it off the cold-start path unless explicitly enabled
+if os.getenv("ENABLE_IMAGE_FETCH"):
+    from ddgs import DDGS
 
-# Initialize Gemini Client (Key should be in Vercel Env Vars)
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# Module globals (clients, sessions, caches) are created once per container and
+# persist across warm Vercel invocations until the container is recycled, so every
+# session-like object lives at module scope rather than inside the handler.
 
-# Define retry logic for Gemini generation
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-def call_gemini_with_retry(prompt_text):
-    return client.models.generate_content(
-        model="gemini-3-flash-preview", 
-        contents=prompt_text,
-        config={
-            "response_mime_type": "application/json"
-        }
+def create_gemini_client() -> genai.Client:
+    # Key should be in Vercel Env Vars
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+def create_async_http() -> httpx.AsyncClient:
+    # Shared async HTTP client for the Invidious fallback so instances can be probed
+    # concurrently and connections (and TLS handshakes) are reused for caption fetches.
+    # HTTP/2 lets the metadata and caption requests to one instance share a connection
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        timeout=10.0,
+        follow_redirects=True,
     )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global ASYNC_HTTP, client, _prompt_cache, _prompt_cache_lock
+    # A previous shutdown in this process (in-process restart, reused TestClient)
+    # closed both clients together, so rebuild them before serving again. The lock
+    # is tied to the previous event loop, so the prompt cache state starts over too.
+    if ASYNC_HTTP.is_closed:
+        ASYNC_HTTP = create_async_http()
+        client = create_gemini_client()
+        _prompt_cache = initial_prompt_cache()
+        _prompt_cache_lock = asyncio.Lock()
+    yield
+    # Close pooled connections cleanly when the server shuts down
+    await ASYNC_HTTP.aclose()
+    await client.aio.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+# Initialize Gemini Client
+client = create_gemini_client()
+
+# Optional proxy for YouTube transcript requests, read once at startup
+YOUTUBE_PROXY = os.getenv("YOUTUBE_PROXY")
+YOUTUBE_PROXIES = {"http": YOUTUBE_PROXY, "https": YOUTUBE_PROXY} if YOUTUBE_PROXY else None
+
+ASYNC_HTTP = create_async_http()
+
+INVIDIOUS_INSTANCES = [
+    "https://invidious.flokinet.to",
+    "https://inv.tux.pizza",
+    "https://vid.puffyan.us",
+    "https://invidious.drgns.space",
+    "https://invidious.privacydev.net",
+    "https://yt.drgnz.club",
+    "https://invidious.nerdvpn.de",
+]
+
+# Seconds a failing instance is skipped before it is probed again
+INSTANCE_COOLDOWN = 300
+# Per-instance health: the monotonic time until which a failing instance is skipped
+INSTANCE_STATS: dict[str, dict] = {
+    instance: {"cooldown_until": 0.0} for instance in INVIDIOUS_INSTANCES
+}
+
+class TTLCache:
+    """
+    Minimal process-local LRU cache with per-entry expiry.
+    Module globals survive between warm invocations, so hits skip the slow path entirely.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+# Gemini output keyed on sha256(prompt). Generation is sampled (default temperature),
+# so a cached itinerary is one sample deliberately reused for identical prompts. With
+# SPECULATIVE_GEMINI the stored answer may come from the hinted short-transcript prompt.
+ITINERARY_CACHE = TTLCache(maxsize=256, ttl=86400)
+
+# Seconds to wait on YouTubeTranscriptApi before moving on to the Invidious fallback;
+# a silently stalled YouTube would otherwise eat the function's whole time limit
+PRIMARY_TRANSCRIPT_TIMEOUT = 8.0
+
+# Max transcript characters sent to Gemini (~4k tokens)
+TRANSCRIPT_CHAR_BUDGET = 15000
+
+# Transcripts keyed on video_id; they are immutable so a long TTL is safe
+TRANSCRIPT_CACHE = TTLCache(maxsize=1000, ttl=7 * 86400)
+
+# Shared transcript client; it owns a requests.Session, so keeping one instance
+# keeps the connection pool to YouTube alive across warm invocations
+YT_API = YouTubeTranscriptApi(
+    proxy_config=GenericProxyConfig(http_url=YOUTUBE_PROXY, https_url=YOUTUBE_PROXY) if YOUTUBE_PROXY else None
+)
+
+GEMINI_MODEL = "gemini-3-flash-preview"
+
+VIDEO_ID_RE = re.compile(r"(?:v=|/)([0-9A-Za-z_-]{11})")
+# Matches VTT cue text lines, skipping the header, cue numbers, timestamps and blank lines
+VTT_CUE_RE = re.compile(r"^(?!WEBVTT|\s*\d+\s*$|.*-->|\s*$)(.+)$", re.MULTILINE)
+
+# Static instructions + schema. Identical on every call, so they are sent as the
+# system instruction (ahead of the transcript) and uploaded once as a context cache
+ITINERARY_INSTRUCTIONS = """
+Create a detailed day-by-day travel itinerary based on the transcript provided.
+Return the response in raw JSON format with the following structure:
+{
+    "trip_title": "Title of the trip",
+    "summary": "Brief summary of the trip",
+    "days": [
+        {
+            "day_number": 1,
+            "theme": "Theme of the day",
+            "image_query": "A specific search query to find a beautiful image for this day (e.g. 'Eiffel Tower Paris', 'Colosseum Rome')",
+            "activities": [
+                {
+                    "time": "Time of day (e.g., Morning, 10:00 AM)",
+                    "activity": "Name of activity",
+                    "description": "Description of activity"
+                }
+            ]
+        }
+    ]
+}
+"""
+
+# Only the transcript varies per request; it follows the cached instructions
+TRANSCRIPT_PREFIX = "Transcript: "
+
+# Short transcripts tend to produce thin itineraries. When enabled, they are sent twice
+# concurrently (as-is and with SHORT_TRANSCRIPT_HINT) and the first valid answer wins.
+# This doubles token cost for those requests, hence the opt-in flag.
+SPECULATIVE_GEMINI = bool(os.getenv("ENABLE_SPECULATIVE_GEMINI"))
+SHORT_TRANSCRIPT_CHARS = 500
+SHORT_TRANSCRIPT_HINT = "Note: the transcript is short or partial. Fill in the gaps using general knowledge of the destination.\n"
+
+PROMPT_CACHE_TTL = 3600
+# Explicit context caches must hold at least this many tokens (Gemini Flash minimum).
+# The scaffold is only a few hundred tokens today (~4 chars per token), so explicit
+# caching stays off and no cold start waits on a caches.create call bound to fail;
+# it kicks in automatically if the instructions grow past the minimum.
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+def initial_prompt_cache() -> tuple[str, float] | None:
+    # None means "create on first use"; ("", inf) turns explicit caching off
+    return None if len(ITINERARY_INSTRUCTIONS) // 4 >= PROMPT_CACHE_MIN_TOKENS else ("", float("inf"))
+
+# (cache name, expiry) of the explicit context cache; name is "" if caching is off
+_prompt_cache: tuple[str, float] | None = initial_prompt_cache()
+# Serializes cache creation so concurrent requests don't each create (and pay for) a cache
+_prompt_cache_lock = asyncio.Lock()
+
+async def get_prompt_cache_name() -> Optional[str]:
+    """
+    Returns the name of the Gemini context cache holding ITINERARY_INSTRUCTIONS,
+    creating it on first use or after it expires.
+    Returns None if the cache can't be created (e.g. prompt below the model's minimum cacheable size).
+    """
+    global _prompt_cache
+    async with _prompt_cache_lock:
+        if _prompt_cache is None or _prompt_cache[1] < time.monotonic():
+            try:
+                cache = await client.aio.caches.create(
+                    model=GEMINI_MODEL,
+                    config={
+                        "system_instruction": ITINERARY_INSTRUCTIONS,
+                        "ttl": f"{PROMPT_CACHE_TTL}s"
+                    }
+                )
+                # Refresh a minute early so we never reference an expired cache
+                _prompt_cache = (cache.name, time.monotonic() + PROMPT_CACHE_TTL - 60)
+            except Exception as e:
+                if isinstance(e, errors.ClientError) and not is_transient_gemini_error(e):
+                    # Rejected request (e.g. scaffold below the minimum cacheable size) won't
+                    # succeed later either, so stop trying for the life of the process
+                    print(f"DEBUG: Context cache rejected, sending instructions inline: {e}")
+                    _prompt_cache = ("", float("inf"))
+                else:
+                    # Transient (429, 5xx, network); try creating it again later
+                    print(f"DEBUG: Context cache unavailable, sending instructions inline: {e}")
+                    _prompt_cache = ("", time.monotonic() + PROMPT_CACHE_TTL)
+        return _prompt_cache[0] or None
+
+def is_transient_gemini_error(e: BaseException) -> bool:
+    """
+    Only server errors, rate limiting (429) and network failures are worth retrying;
+    other 4xx errors (bad request, auth, quota config) fail the same way every time.
+    """
+    if isinstance(e, errors.ClientError):
+        return e.code == 429
+    return isinstance(e, (errors.ServerError, httpx.TransportError, TimeoutError))
+
+# Define retry logic for Gemini generation (tenacity awaits the backoff with asyncio.sleep)
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    retry=retry_if_exception(is_transient_gemini_error)
+)
+async def acall_gemini_with_retry(prompt_text):
+    global _prompt_cache
+    config = {
+        "response_mime_type": "application/json"
+    }
+    cache_name = await get_prompt_cache_name()
+    if cache_name:
+        config["cached_content"] = cache_name
+    else:
+        config["system_instruction"] = ITINERARY_INSTRUCTIONS
+
+    try:
+        return await client.aio.models.generate_content(
+            model=GEMINI_MODEL, 
+            contents=prompt_text,
+            config=config
+        )
+    except errors.ClientError as e:
+        if not (cache_name and e.code == 404):
+            raise
+        # Cache was evicted server-side; drop it (the next call re-creates it)
+        # and resend this one with the instructions inline
+        _prompt_cache = None
+        del config["cached_content"]
+        config["system_instruction"] = ITINERARY_INSTRUCTIONS
+        return await client.aio.models.generate_content(
+            model=GEMINI_MODEL, 
+            contents=prompt_text,
+            config=config
+        )
+
+async def acall_gemini_first_valid(prompts: list[str]):
+    """
+    Runs the Gemini call for each prompt concurrently and returns the first response
+    that parses as JSON, cancelling the rest.
+    Falls back to the last response received (or re-raises the last error) if none is valid.
+    """
+    tasks = [asyncio.create_task(acall_gemini_with_retry(p)) for p in prompts]
+    last_response, last_error = None, None
+    try:
+        for next_call in asyncio.as_completed(tasks):
+            try:
+                response = await next_call
+            except Exception as e:
+                print(f"DEBUG: Speculative Gemini call failed: {e}")
+                last_error = e
+                continue
+            last_response = response
+            if response.text:
+                try:
+                    orjson.loads(response.text)
+                    return response
+                except orjson.JSONDecodeError:
+                    pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if last_response is None:
+        raise last_error
+    return last_response
+
 def fetch_subtitles_ytdlp(video_id: str, language: str = "en") -> Optional[str]:
     """
     Uses yt-dlp to download the best-available subtitles for a YouTube video.
@@ -102,119 +370,167 @@ def fetch_subtitles_ytdlp(video_id: str, language: str = "en") -> Optional[str]:
 
     return None
 
+def join_snippets(snippets) -> str:
+    """
+    Joins transcript snippets, stopping once TRANSCRIPT_CHAR_BUDGET is reached
+    so long videos don't build a huge string only to have it truncated.
+    """
+    buf = []
+    n = 0
+    for text in snippets:
+        buf.append(text)
+        n += len(text) + 1
+        if n > TRANSCRIPT_CHAR_BUDGET:
+            break
+    return " ".join(buf)
+
+def record_instance_success(instance: str):
+    INSTANCE_STATS[instance]["cooldown_until"] = 0.0
+
+def record_instance_failure(instance: str):
+    # Only called for errors and 5xx; a 4xx is about the video (private, removed,
+    # region-locked), not the instance, and must not sideline it for other videos
+    INSTANCE_STATS[instance]["cooldown_until"] = time.monotonic() + INSTANCE_COOLDOWN
+
+def healthy_invidious_instances() -> list[str]:
+    """
+    Returns the instances not in cooldown.
+    If every instance is cooling down, all of them are tried anyway.
+    """
+    now = time.monotonic()
+    healthy = [i for i in INVIDIOUS_INSTANCES if INSTANCE_STATS[i]["cooldown_until"] <= now]
+    return healthy or INVIDIOUS_INSTANCES
+
+async def probe_invidious_instance(instance: str, video_id: str) -> tuple[str, Optional[str]]:
+    """
+    Fetches video metadata from a single Invidious instance.
+    Returns (instance, caption_url), with caption_url None if the instance failed
+    or has no English captions for the video.
+    """
+    print(f"DEBUG: Trying Invidious instance: {instance}")
+    try:
+        res = await ASYNC_HTTP.get(f"{instance}/api/v1/videos/{video_id}")
+        if res.is_server_error:
+            record_instance_failure(instance)
+        elif res.status_code == 200:
+            record_instance_success(instance)
+            data = res.json()
+            captions = data.get("captions", [])
+            # Find English caption
+            for cap in captions:
+                if cap.get("language") == "English" or cap.get("code", "").startswith("en"):
+                    return instance, instance + cap.get("url")
+    except Exception as inv_e:
+        print(f"Failed {instance}: {inv_e}")
+        record_instance_failure(instance)
+    return instance, None
+
+async def fetch_transcript_invidious(video_id: str) -> Optional[str]:
+    """
+    Probes the Invidious instances not in cooldown concurrently and downloads the English captions
+    from the first instance that answers with them.
+    Returns a plain-text string (joined captions) or None on failure.
+    """
+    tasks = [asyncio.create_task(probe_invidious_instance(instance, video_id)) for instance in healthy_invidious_instances()]
+    try:
+        for next_probe in asyncio.as_completed(tasks):
+            instance, caption_url = await next_probe
+            if not caption_url:
+                continue
+            try:
+                # Stream the captions and keep only cue text lines, rather than
+                # materializing the whole VTT payload before parsing it
+                async with ASYNC_HTTP.stream("GET", caption_url) as cap_res:
+                    if cap_res.status_code == 200:
+                        text_lines = []
+                        n = 0
+                        async for line in cap_res.aiter_lines():
+                            if m := VTT_CUE_RE.match(line):
+                                text_lines.append(m.group(1).strip())
+                                n += len(text_lines[-1]) + 1
+                                # Anything past the budget would be cut from the prompt anyway
+                                if n > TRANSCRIPT_CHAR_BUDGET:
+                                    break
+                        print(f"Success from {instance}")
+                        return " ".join(text_lines)
+                    if cap_res.is_server_error:
+                        record_instance_failure(instance)
+            except Exception as inv_e:
+                print(f"Failed {instance}: {inv_e}")
+                record_instance_failure(instance)
+    finally:
+        # Cancel the probes still in flight once we have a transcript
+        for task in tasks:
+            task.cancel()
+
+    return None
+
 @app.get("/api/generate")
 async def generate_itinerary(url: str):
     try:
         # 1. Extract Video ID
-        video_id = re.search(r"(?:v=|\/)([0-9A-Za-z_-]{11})", url).group(1)
+        match = VIDEO_ID_RE.search(url)
+        if not match:
+            raise HTTPException(status_code=400, detail="Could not find a YouTube video ID in the URL.")
+        video_id = match.group(1)
         print(f"DEBUG: Processing video_id={video_id}")
         
         
-        # 2. Get Transcript
-        transcript_text = None
-        
-        # Method A: Official/Standard Library (with optional proxy)
-        try:
-            proxies = None
-            if os.getenv("YOUTUBE_PROXY"):
-                proxies = {"http": os.getenv("YOUTUBE_PROXY"), "https": os.getenv("YOUTUBE_PROXY")}
-            
+        # 2. Get Transcript (transcripts never change, so repeats skip the whole fetch chain)
+        transcript_text = TRANSCRIPT_CACHE.get(video_id)
+        if transcript_text:
+            print("DEBUG: Serving transcript from cache")
+        else:
+            # Method A: Official/Standard Library (with optional proxy)
             try:
-                print("DEBUG: Attempting standard YouTubeTranscriptApi fetch...")
-                # Try standard standard static method
-                if hasattr(YouTubeTranscriptApi, 'get_transcript'):
-                    transcript = YouTubeTranscriptApi.get_transcript(video_id, proxies=proxies)
-                    transcript_text = " ".join([t['text'] for t in transcript])
-                else:
-                    print("DEBUG: Falling back to instance fetch (legacy/weird version support)")
-                    # Fallback to instance fetch (legacy/weird version support)
-                    yt = YouTubeTranscriptApi()
-                    transcript = yt.fetch(video_id)
-                    transcript_text = " ".join([t.text for t in transcript])
+                try:
+                    print("DEBUG: Attempting standard YouTubeTranscriptApi fetch...")
+                    # Try standard standard static method
+                    if hasattr(YouTubeTranscriptApi, 'get_transcript'):
+                        transcript = await asyncio.wait_for(
+                            run_in_threadpool(YouTubeTranscriptApi.get_transcript, video_id, proxies=YOUTUBE_PROXIES),
+                            timeout=PRIMARY_TRANSCRIPT_TIMEOUT
+                        )
+                        transcript_text = join_snippets(t['text'] for t in transcript)
+                    else:
+                        print("DEBUG: Falling back to instance fetch (legacy/weird version support)")
+                        # Fallback to instance fetch (legacy/weird version support)
+                        transcript = await asyncio.wait_for(
+                            run_in_threadpool(YT_API.fetch, video_id),
+                            timeout=PRIMARY_TRANSCRIPT_TIMEOUT
+                        )
+                        transcript_text = join_snippets(t.text for t in transcript)
+                except Exception as e:
+                    # If standard fails (even with fallback), raise to trigger Invidious
+                    print(f"Standard fetch failed: {e!r}")
+                    raise e
             except Exception as e:
-                # If standard fails (even with fallback), raise to trigger Invidious
-                print(f"Standard fetch failed: {e}")
-                raise e
-        except Exception as e:
-            print(f"DEBUG: Primary fetch failed: {e}")
+                print(f"DEBUG: Primary fetch failed: {e}")
             
-            # Method B: Invidious Fallback (No proxy needed usually)
-            print("Attempting Invidious fallback...")
-            invidious_instances = [
-                "https://invidious.flokinet.to",
-                "https://inv.tux.pizza",
-                "https://vid.puffyan.us",
-                "https://invidious.drgns.space",
-                "https://invidious.privacydev.net",
-                "https://yt.drgnz.club",
-                "https://invidious.nerdvpn.de",
-            ]
+                # Method B: Invidious Fallback (No proxy needed usually)
+                print("Attempting Invidious fallback...")
+                transcript_text = await fetch_transcript_invidious(video_id)
             
-            for instance in invidious_instances:
-                print(f"DEBUG: Trying Invidious instance: {instance}")
-                try:
-                    # Get video metadata for captions
-                    # Increased timeout to 10s
-                    res = requests.get(f"{instance}/api/v1/videos/{video_id}", timeout=10)
-                    if res.status_code == 200:
-                        data = res.json()
-                        captions = data.get("captions", [])
-                        # Find English caption
-                        caption_url = None
-                        for cap in captions:
-                            if cap.get("language") == "English" or cap.get("code", "").startswith("en"):
-                                caption_url = instance + cap.get("url")
-                                break
-                        
-                        if caption_url:
-                            cap_res = requests.get(caption_url, timeout=10)
-                            if cap_res.status_code == 200:
-                                # Simple VTT parser
-                                lines = cap_res.text.splitlines()
-                                text_lines = []
-                                for line in lines:
-                                    if "-->" not in line and not line.strip().isdigit() and line.strip() and not line.startswith("WEBVTT"):
-                                        text_lines.append(line.strip())
-                                transcript_text = " ".join(text_lines)
-                                print(f"Success from {instance}")
-                                break
-                except Exception as inv_e:
-                    print(f"Failed {instance}: {inv_e}")
-                    continue
+                if not transcript_text:
+                    print("DEBUG: Falling back to yt-dlp subtitle fetch")
+                    transcript_text = await run_in_threadpool(fetch_subtitles_ytdlp, video_id)
             
-            if not transcript_text:
-                print("DEBUG: Falling back to yt-dlp subtitle fetch")
-                transcript_text = fetch_subtitles_ytdlp(video_id)
+                if not transcript_text:
+                    raise HTTPException(status_code=429, detail="YouTube blocked requests and all fallbacks failed. Please configure a proxy.")
             
-            if not transcript_text:
-                raise HTTPException(status_code=429, detail="YouTube blocked requests and all fallbacks failed. Please configure a proxy.")
+            TRANSCRIPT_CACHE.set(video_id, transcript_text)
         
-        prompt = f"""
-        Create a detailed day-by-day travel itinerary based on the following transcript.
-        Return the response in raw JSON format with the following structure:
-        {{
-            "trip_title": "Title of the trip",
-            "summary": "Brief summary of the trip",
-            "days": [
-                {{
-                    "day_number": 1,
-                    "theme": "Theme of the day",
-                    "image_query": "A specific search query to find a beautiful image for this day (e.g. 'Eiffel Tower Paris', 'Colosseum Rome')",
-                    "activities": [
-                        {{
-                            "time": "Time of day (e.g., Morning, 10:00 AM)",
-                            "activity": "Name of activity",
-                            "description": "Description of activity"
-                        }}
-                    ]
-                }}
-            ]
-        }}
+        prompt = TRANSCRIPT_PREFIX + transcript_text[:TRANSCRIPT_CHAR_BUDGET]
         
-        Transcript: {transcript_text[:15000]}
-        """
+        prompt_key = hashlib.sha256(prompt.encode()).hexdigest()
+        if cached := ITINERARY_CACHE.get(prompt_key):
+            print("DEBUG: Serving itinerary from cache")
+            return orjson.loads(cached)
         
-        response = call_gemini_with_retry(prompt)
+        if SPECULATIVE_GEMINI and len(transcript_text) < SHORT_TRANSCRIPT_CHARS:
+            response = await acall_gemini_first_valid([prompt, SHORT_TRANSCRIPT_HINT + prompt])
+        else:
+            response = await acall_gemini_with_retry(prompt)
         
         print("\n\n=== Token Usage ===\n")
         print(response.usage_metadata)
@@ -227,7 +543,8 @@ async def generate_itinerary(url: str):
             return {"error": "The AI model returned an empty response. This might be due to safety filters or overload.", "detail": str(response)}
 
         try:
-            itinerary_data = json.loads(response.text)
+            itinerary_data = orjson.loads(response.text)
+            ITINERARY_CACHE.set(prompt_key, response.text)
             
             # Fetch images for each day
             # print("Fetching images...")
@@ -248,9 +565,11 @@ async def generate_itinerary(url: str):
             #                 # day["image_url"] = f"https://placehold.co/800x400?text={query.replace(' ', '+')}"
                             
             return itinerary_data
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             # Fallback if model fails to return valid JSON (rare with 2.0 Flash + JSON mode)
             return {"error": "Failed to generate structured itinerary", "raw_text": response.text}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 